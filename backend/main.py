@@ -3,32 +3,96 @@ Fetch.ai Chat Agent + FastAPI WebSocket Server
 Everything in one main.py file
 """
 
+import time
+_MODULE_LOAD_STARTED = time.perf_counter()
+
 import os
 import json
+import math
+import hmac
+import hashlib
+import secrets
 import asyncio
 import sys
 import re
-import requests
-from datetime import datetime
+import sqlite3
+import threading
+import zlib
+import urllib.parse
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from uuid import uuid4
-from typing import Optional, List
+from typing import Optional, TYPE_CHECKING
 
-import google.generativeai as genai
-from uagents import Agent, Context, Protocol, Model
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-import urllib 
+
+# Heavy clients (google.generativeai, uagents, requests, numpy) are imported on first use
+if TYPE_CHECKING:
+    import numpy as np
+    from uagents import Context
+
 # Load environment variables
 load_dotenv()
 
-# Initialize Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-flash')
+# Lazy client initialization – nothing heavy happens until a request needs it
+_init_lock = threading.Lock()
+_init_timings = {}
+_genai = None
+_model = None
+_http = None
+
+def _timed_init(name: str, fn):
+    started = time.perf_counter()
+    value = fn()
+    _init_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    print(f"Initialized {name} in {_init_timings[name]} ms")
+    return value
+
+def get_genai():
+    global _genai
+    if _genai is None:
+        with _init_lock:
+            if _genai is None:
+                def _load():
+                    import google.generativeai as genai
+                    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                    return genai
+                _genai = _timed_init("gemini_sdk", _load)
+    return _genai
 
+def get_model():
+    global _model
+    if _model is None:
+        genai = get_genai()
+        with _init_lock:
+            if _model is None:
+                _model = _timed_init("gemini_model", lambda: genai.GenerativeModel('gemini-2.5-flash'))
+    return _model
+
+def get_http():
+    """Shared requests.Session so Mapbox calls reuse keep-alive connections."""
+    global _http
+    if _http is None:
+        with _init_lock:
+            if _http is None:
+                def _load():
+                    import requests
+                    return requests.Session()
+                _http = _timed_init("http", _load)
+    return _http
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Optional background warm-up; the server accepts connections while it runs
+    if WARMUP_ON_STARTUP:
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+    yield
 
 # FastAPI app
-app = FastAPI(title="Fetch.ai Chat Agent + WebSocket Server")
+app = FastAPI(title="Fetch.ai Chat Agent + WebSocket Server", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -39,48 +103,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Fetch.ai Agent (kept minimal; no extra ports, no subprocess)
-chat_agent = Agent(name="chat-router")
+# Fetch.ai Agent (kept minimal; no extra ports, no subprocess) – built by get_chat_agent()
+_chat_agent = None
+SimpleMessage = None
 
-# Simple message protocol using Pydantic Model
-class SimpleMessage(Model):
-    text: str
-    msg_id: str = None
-    timestamp: datetime = None
-    
-    def __init__(self, **kwargs):
-        if kwargs.get('msg_id') is None:
-            kwargs['msg_id'] = str(uuid4())
-        if kwargs.get('timestamp') is None:
-            kwargs['timestamp'] = datetime.utcnow()
-        super().__init__(**kwargs)
-
-# Mapbox agent communication models
-class GeocodeRequest(Model):
-    query: str
-    limit: int = 5
-
-class GeocodeResponse(Model):
-    result: dict
-    success: bool
-
-class DirectionsRequest(Model):
-    profile: str
-    coordinates: list
-    alternatives: bool = False
-
-class DirectionsResponse(Model):
-    result: dict
-    success: bool
-
-# Create simple protocol
-chat_proto = Protocol("ChatProtocol", "0.1.0")
-
-# Conversation history
+# Conversation history (agent path uses the global list, WebSocket sessions get their own)
 conversation_history = []
+session_histories = {}
+# Latest route/itinerary from any session, for the /route/latest and /itinerary/latest endpoints
 last_directions_json = None
 last_route_summary = None
 last_itinerary_json = None
+# Per-session route state used for follow-ups and prompt references (None = uAgents chat path)
+session_routes = {}
+
+def get_session_route(session_id: str = None) -> dict:
+    return session_routes.setdefault(session_id, {"directions": None, "summary": None, "itinerary": None})
 
 def is_travel_question(message: str) -> bool:
     """Check if the message is travel-related"""
@@ -103,8 +141,381 @@ def is_how_long_followup(message: str) -> bool:
 def is_itinerary_question(message: str) -> bool:
     return "itinerary" in message.lower()
 
+# Local follow-up answers from the cached directions JSON (no Gemini call)
+_ORDINALS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5,
+    "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10,
+}
+_PART_RE = re.compile(
+    r"\b(step|turn|leg)\s*(?:#|no\.?\s*|number\s*)?(\d+)\b"
+    r"|\b(\d+)(?:st|nd|rd|th)\s+(step|turn|leg)\b"
+    r"|\b(first|second|third|fourth|fifth|sixth|seventh|eighth|ninth|tenth|last|final)\s+(step|turn|leg)\b"
+)
+_COUNT_PARTS_RE = re.compile(r"\bhow many\s+(steps|turns|legs|stops)\b")
+_LIST_STEPS_RE = re.compile(r"\b(?:list|show|give|read|what are)\b.*\b(?:steps|turns|directions|instructions)\b")
+_DISTANCE_RE = re.compile(r"\bhow far\b|\bdistance\b|\bhow many (?:miles|kilometers|kilometres|km)\b")
+_ARRIVE_RE = re.compile(r"\b(?:arrive|arrival|get there|get in|reach|eta|be there)\b")
+_LEAVE_BY_RE = re.compile(r"\b(?:when|what time)\s+(?:should|do|must|would)\s+i\s+(?:leave|depart|head out|set off|go)\b")
+# A follow-up must point back at the cached route ("that", "the drive", "get there", ...)
+_ROUTE_REF_RE = re.compile(
+    r"\b(?:that|it|(?:get|go|drive|head|ride|arrive|be|reach)(?:ing)? there"
+    r"|(?:the|this|my) (?:route|drive|trip|ride|journey|directions))\b"
+)
+# Whatever follows from/to/near/between, up to a few words ("to san jose", "to the moon", "to cook pasta")
+_TARGET_RE = re.compile(
+    r"\b(?:from|to|near|between)\s+"
+    r"((?!(?:by|at|if|and|when|with|in|on|for|or|before|after|around)\b)[a-z][\w'.-]*"
+    r"(?:\s+(?!(?:by|at|if|and|when|with|in|on|for|or|before|after|around|to|from)\b)[a-z][\w'.-]*){0,3})"
+)
+# Targets that still mean the cached route: travel verbs ("to get there"), anaphors, route nouns
+_ROUTE_TARGET_WORDS = {
+    "get", "go", "drive", "head", "reach", "arrive", "be", "travel", "make",
+    "there", "here", "it", "that", "route", "trip", "destination", "start", "origin",
+}
+# The cached route is a driving route; questions about other modes go to Gemini
+_OTHER_MODE_RE = re.compile(
+    r"\b(?:bike|biking|bicycle|cycling|cycle|walk|walking|on foot|bus|train|transit|subway|metro"
+    r"|fly|flying|flight|plane|ferry|boat|scooter)\b"
+)
+_CLOCK_RE = re.compile(
+    r"\b(\d{1,2})(?::([0-5]\d))?\s*([ap])\.?m\b\.?"
+    r"|\b([01]?\d|2[0-3]):([0-5]\d)\b"
+    r"|\b(noon|midnight)\b"
+)
+
+
+def _format_duration(seconds: float) -> str:
+    minutes = int(round(seconds / 60))
+    if minutes < 60:
+        return f"{max(minutes, 1)} min"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} h {minutes} min" if minutes else f"{hours} h"
+
+
+def _format_distance(meters: float, metric: bool = False) -> str:
+    if metric:
+        return f"{meters / 1000:.1f} km"
+    return f"{meters * 0.000621371:.1f} miles"
+
+
+def _format_clock(dt: datetime, base: datetime) -> str:
+    text = dt.strftime("%I:%M %p").lstrip("0")
+    days = (dt.date() - base.date()).days
+    if days == 1:
+        text += " (next day)"
+    elif days == -1:
+        text += " (previous day)"
+    return text
+
+
+def _parse_clock(message: str, now: datetime) -> Optional[datetime]:
+    """Find a clock time like '5pm', '5:30 p.m.', '17:30' or 'noon' in the message."""
+    m = _CLOCK_RE.search(message)
+    if not m:
+        return None
+    if m.group(6):
+        hour, minute = (12, 0) if m.group(6) == "noon" else (0, 0)
+    elif m.group(1):
+        if int(m.group(1)) > 12:
+            return None
+        hour, minute = int(m.group(1)) % 12, int(m.group(2) or 0)
+        if m.group(3) == "p":
+            hour += 12
+    else:
+        hour, minute = int(m.group(4)), int(m.group(5))
+    return now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+
+def _refers_to_route(message: str, origin: Optional[str], destination: Optional[str]) -> bool:
+    """
+    True if the message is about the cached route rather than some other place or topic.
+    Anything after from/to/near/between must be the route's origin/destination, a travel
+    verb or an anaphor, so "it take to cook pasta" or "it to the moon" don't count.
+    """
+    m = message.lower()
+    if _OTHER_MODE_RE.search(m):
+        return False
+    places = [p.lower() for p in (origin, destination) if p]
+    for target in _TARGET_RE.findall(m):
+        words = target.split()
+        if words[0] in ("the", "a", "an") and len(words) > 1:
+            words = words[1:]
+        if words[0] in _ROUTE_TARGET_WORDS:
+            continue
+        name = " ".join(words)
+        if not any(name.startswith(p) or p.startswith(name) for p in places):
+            return False
+    return bool(_ROUTE_REF_RE.search(m)) or any(re.search(rf"\b{re.escape(p)}\b", m) for p in places)
+
+
+def _leg_duration(leg: dict) -> float:
+    if leg.get("duration") is not None:
+        return leg["duration"]
+    # Fall back to per-segment annotations when the leg total is missing
+    return sum((leg.get("annotation") or {}).get("duration") or [])
+
+
+def _leg_distance(leg: dict) -> float:
+    if leg.get("distance") is not None:
+        return leg["distance"]
+    return sum((leg.get("annotation") or {}).get("distance") or [])
+
+
+def _route_steps(route: dict) -> list:
+    return [step for leg in route.get("legs", []) for step in leg.get("steps", [])]
+
+
+def _pick_part(items: list, index_word: str) -> Optional[dict]:
+    if not items:
+        return None
+    if index_word in ("last", "final"):
+        return items[-1]
+    n = _ORDINALS.get(index_word) or int(index_word)
+    if 1 <= n <= len(items):
+        return items[n - 1]
+    return None
+
+
+def answer_route_followup(message: str, session_id: str = None) -> Optional[str]:
+    """
+    Answer duration/distance/ETA/step follow-ups straight from the session's cached directions.
+    Returns None when there is no cached route, the question doesn't refer back to
+    it, or it isn't recognised, so the caller can fall back to Gemini.
+    """
+    state = get_session_route(session_id)
+    directions, summary = state["directions"], state["summary"]
+    if not directions or not directions.get("routes"):
+        return None
+    route = directions["routes"][0]
+    m = message.lower()
+    metric = bool(re.search(r"\bkm\b|kilomet", m))
+
+    origin = summary.get("origin") if summary else None
+    destination = summary.get("destination") if summary else None
+    trip = f" from {origin} to {destination}" if origin and destination else ""
+    if not _refers_to_route(message, origin, destination):
+        return None
+
+    total_duration = route.get("duration")
+    if total_duration is None:
+        total_duration = sum(_leg_duration(leg) for leg in route.get("legs", []))
+    total_distance = route.get("distance")
+    if total_distance is None:
+        total_distance = sum(_leg_distance(leg) for leg in route.get("legs", []))
+
+    # Per-step / per-leg questions ("what's step 3", "how long is the second leg")
+    part = _PART_RE.search(m)
+    if part:
+        if part.group(1):
+            kind, index_word = part.group(1), part.group(2)
+        elif part.group(3):
+            kind, index_word = part.group(4), part.group(3)
+        else:
+            kind, index_word = part.group(6), part.group(5)
+        if kind == "leg":
+            legs = route.get("legs", [])
+            leg = _pick_part(legs, index_word)
+            if leg is None:
+                return f"This route has {len(legs)} leg{'s' if len(legs) != 1 else ''}."
+            n = legs.index(leg) + 1
+            summary = f" via {leg['summary']}" if leg.get("summary") else ""
+            return (
+                f"Leg {n}{summary} takes about {_format_duration(_leg_duration(leg))} "
+                f"and covers {_format_distance(_leg_distance(leg), metric)}."
+            )
+        steps = _route_steps(route)
+        step = _pick_part(steps, index_word)
+        if step is None:
+            return f"This route has {len(steps)} step{'s' if len(steps) != 1 else ''}."
+        n = steps.index(step) + 1
+        instruction = (step.get("maneuver") or {}).get("instruction") or step.get("name") or "Continue"
+        return (
+            f"Step {n}: {instruction} "
+            f"({_format_distance(step.get('distance', 0), metric)}, "
+            f"about {_format_duration(step.get('duration', 0))})."
+        )
+
+    count = _COUNT_PARTS_RE.search(m)
+    if count:
+        if count.group(1) in ("legs", "stops"):
+            n = len(route.get("legs", []))
+            return f"This route has {n} leg{'s' if n != 1 else ''}."
+        n = len(_route_steps(route))
+        return f"This route has {n} step{'s' if n != 1 else ''}."
+
+    if _LIST_STEPS_RE.search(m):
+        steps = _route_steps(route)
+        if not steps:
+            return None
+        lines = [
+            f"{i}. {(s.get('maneuver') or {}).get('instruction') or s.get('name') or 'Continue'} "
+            f"({_format_distance(s.get('distance', 0), metric)})"
+            for i, s in enumerate(steps[:10], start=1)
+        ]
+        if len(steps) > 10:
+            lines.append(f"...and {len(steps) - 10} more steps.")
+        return "\n".join(lines)
+
+    # ETA / leave-by questions ("if I leave at 5pm when will I arrive")
+    now = datetime.now()
+    wants_duration = is_how_long_followup(message)
+    if _LEAVE_BY_RE.search(m):
+        arrive_at = _parse_clock(m, now)
+        if arrive_at is None:
+            return None
+        leave_at = arrive_at - timedelta(seconds=total_duration)
+        return (
+            f"To arrive by {_format_clock(arrive_at, now)}, leave by "
+            f"{_format_clock(leave_at, now)} (the trip{trip} takes about {_format_duration(total_duration)})."
+        )
+    leave_at = _parse_clock(m, now)
+    if _ARRIVE_RE.search(m) and (leave_at or not wants_duration):
+        departure = f"leave at {_format_clock(leave_at, now)}" if leave_at else "leave now"
+        arrive_at = (leave_at or now) + timedelta(seconds=total_duration)
+        return (
+            f"If you {departure}, you'll arrive around {_format_clock(arrive_at, now)} "
+            f"({_format_duration(total_duration)}{trip})."
+        )
+
+    wants_distance = bool(_DISTANCE_RE.search(m))
+    if wants_duration and wants_distance:
+        return (
+            f"The route{trip} takes about {_format_duration(total_duration)} "
+            f"and covers {_format_distance(total_distance, metric)}."
+        )
+    if wants_duration:
+        return f"The route{trip} takes about {_format_duration(total_duration)}."
+    if wants_distance:
+        return f"The route{trip} is {_format_distance(total_distance, metric)}."
+    return None
+
+
+# Token-budgeted prompt context with a rolling per-session summary
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_TURN_MAX_TOKENS = 300
+_session_summaries = {}
+# Session ids are issued by the server and signed, so clients can resume but not guess or forge them.
+# Set SESSION_SECRET to keep ids valid across restarts; otherwise a per-process secret is used.
+_SESSION_SECRET = (os.getenv("SESSION_SECRET") or secrets.token_hex(32)).encode("utf-8")
+
+def _sign_session(token: str) -> str:
+    return hmac.new(_SESSION_SECRET, token.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+def issue_session_id() -> str:
+    token = secrets.token_urlsafe(16)
+    return f"{token}.{_sign_session(token)}"
+
+def is_valid_session_id(session_id: Optional[str]) -> bool:
+    token, _, signature = (session_id or "").rpartition(".")
+    return bool(token) and hmac.compare_digest(signature, _sign_session(token))
+
+# Sessions are kept across reconnects, but bounded by idle time and count
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "500"))
+_session_last_seen = {}
 
-async def chat_with_gemini_and_mapbox(user_message, ctx: Context = None):
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token) – good enough for budgeting, no tokenizer call."""
+    return (len(text) + 3) // 4
+
+def get_session_history(session_id: str = None) -> list:
+    if session_id is None:
+        return conversation_history
+    return session_histories.setdefault(session_id, [])
+
+def drop_session(session_id: str):
+    session_histories.pop(session_id, None)
+    session_routes.pop(session_id, None)
+    _session_summaries.pop(session_id, None)
+    _session_last_seen.pop(session_id, None)
+
+def touch_session(session_id: str = None):
+    """Mark a session as active and evict idle or excess ones (the agent path's None session is never evicted)."""
+    if session_id is None:
+        return
+    now = time.time()
+    _session_last_seen[session_id] = now
+    for sid, seen in list(_session_last_seen.items()):
+        if now - seen > SESSION_TTL_SECONDS:
+            drop_session(sid)
+    if len(_session_last_seen) > MAX_SESSIONS:
+        for sid in sorted(_session_last_seen, key=_session_last_seen.get)[:len(_session_last_seen) - MAX_SESSIONS]:
+            drop_session(sid)
+
+def _compact_turn(turn: dict) -> str:
+    role = turn.get("role", "user").upper()
+    content = " ".join(turn.get("content", "").split())
+    if content.startswith(("{", "[")):
+        return f"{role}: [structured data omitted]"
+    gist = re.split(r"(?<=[.!?])\s", content, maxsplit=1)[0]
+    if len(gist) > 120:
+        gist = gist[:117] + "..."
+    return f"{role}: {gist}"
+
+def build_context(session_id: str = None, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Recent turns verbatim (newest first until ~2/3 of the budget), older turns
+    folded one line each into the session's rolling summary. Folded turns are
+    dropped from the history, so each turn is only ever compacted once.
+    """
+    history = get_session_history(session_id)
+    summary_lines = _session_summaries.setdefault(session_id, [])
+
+    kept, used = [], 0
+    for turn in reversed(history):
+        line = f"{turn.get('role', 'user').upper()}: {turn.get('content', '')}"
+        if estimate_tokens(line) > CONTEXT_TURN_MAX_TOKENS:
+            line = line[:CONTEXT_TURN_MAX_TOKENS * 4] + " ..."
+        cost = estimate_tokens(line)
+        if used + cost > budget * 2 // 3:
+            break
+        kept.append(line)
+        used += cost
+
+    cut = len(history) - len(kept)
+    if cut:
+        summary_lines.extend(_compact_turn(t) for t in history[:cut])
+        del history[:cut]
+
+    # Roll the oldest summary lines off once the summary outgrows what's left of the budget
+    summary_tokens = sum(estimate_tokens(l) + 1 for l in summary_lines)
+    while summary_lines and summary_tokens > budget - used:
+        summary_tokens -= estimate_tokens(summary_lines.pop(0)) + 1
+
+    parts = []
+    if summary_lines:
+        parts.append("Earlier (summary):\n" + "\n".join(summary_lines))
+    if kept:
+        parts.append("Recent:\n" + "\n".join(reversed(kept)))
+    return "\n".join(parts)
+
+def route_reference(session_id: str = None) -> str:
+    summary = get_session_route(session_id)["summary"]
+    if not summary:
+        return ""
+    return (
+        f"[route: {summary['origin']} -> {summary['destination']}, "
+        f"{summary['duration_minutes']} min, {summary['distance_miles']} mi]"
+    )
+
+def itinerary_reference(session_id: str = None) -> str:
+    itinerary = get_session_route(session_id)["itinerary"]
+    if not itinerary or not itinerary.get("days"):
+        return ""
+    days = itinerary["days"]
+    stops = []
+    for day in days:
+        for leg in day.get("legs", []):
+            name = (leg.get("to") or {}).get("name")
+            if name and name not in stops:
+                stops.append(name)
+    more = ", ..." if len(stops) > 6 else ""
+    return (
+        f"[itinerary: {len(days)} days, {sum(len(d.get('legs', [])) for d in days)} legs, "
+        f"stops: {', '.join(stops[:6])}{more}]"
+    )
+
+async def chat_with_gemini_and_mapbox(user_message, ctx: "Context" = None):
     """Enhanced function to chat with Gemini + Mapbox agent communication"""
     try:
         # Add user message to history
@@ -140,10 +551,16 @@ async def chat_with_gemini_and_mapbox(user_message, ctx: Context = None):
                 print(f"Mapbox agent communication error: {e}")
                 return "I need more details. Can you specify your starting location and destination more clearly?"
         
+        # Route follow-ups (duration, distance, ETA, steps) are answered locally
+        local_answer = answer_route_followup(user_message)
+        if local_answer is not None:
+            conversation_history.append({"role": "assistant", "content": local_answer})
+            return local_answer
+
         # Regular Gemini response
-        response = model.generate_content(
+        response = get_model().generate_content(
             user_message,
-            generation_config=genai.types.GenerationConfig(
+            generation_config=get_genai().types.GenerationConfig(
                 temperature=0.7,
                 max_output_tokens=1000,
             )
@@ -167,17 +584,46 @@ async def chat_with_gemini_and_mapbox(user_message, ctx: Context = None):
     except Exception as e:
         return f"Sorry, I encountered an error: {str(e)}"
 
-@chat_proto.on_message(SimpleMessage)
-async def handle_chat_message(ctx: Context, sender: str, msg: SimpleMessage):
-    ctx.logger.info(f"Chat agent received: {msg.text}")
-    try:
-        response_text = await chat_with_gemini_and_mapbox(msg.text, ctx)
-        await ctx.send(sender, SimpleMessage(text=response_text))
-    except Exception:
-        await ctx.send(sender, SimpleMessage(text="Sorry, I encountered an error processing your message."))
+def get_chat_agent():
+    """Build the uAgents chat agent and protocol on first use (only --run-agent needs it)."""
+    global _chat_agent, SimpleMessage
+    if _chat_agent is not None:
+        return _chat_agent
 
-# Include the protocol
-chat_agent.include(chat_proto)
+    def _load():
+        from uagents import Agent, Context, Protocol, Model
+
+        # Simple message protocol using Pydantic Model
+        class _SimpleMessage(Model):
+            text: str
+            msg_id: str = None
+            timestamp: datetime = None
+
+            def __init__(self, **kwargs):
+                if kwargs.get('msg_id') is None:
+                    kwargs['msg_id'] = str(uuid4())
+                if kwargs.get('timestamp') is None:
+                    kwargs['timestamp'] = datetime.utcnow()
+                super().__init__(**kwargs)
+
+        agent = Agent(name="chat-router")
+        chat_proto = Protocol("ChatProtocol", "0.1.0")
+
+        @chat_proto.on_message(_SimpleMessage)
+        async def handle_chat_message(ctx: Context, sender: str, msg: _SimpleMessage):
+            ctx.logger.info(f"Chat agent received: {msg.text}")
+            try:
+                response_text = await chat_with_gemini_and_mapbox(msg.text, ctx)
+                await ctx.send(sender, _SimpleMessage(text=response_text))
+            except Exception:
+                await ctx.send(sender, _SimpleMessage(text="Sorry, I encountered an error processing your message."))
+
+        # Include the protocol
+        agent.include(chat_proto)
+        return agent, _SimpleMessage
+
+    _chat_agent, SimpleMessage = _timed_init("uagents", _load)
+    return _chat_agent
 
 # Inline Mapbox helpers (no MCP, direct HTTP to Mapbox APIs)
 MAPBOX_TOKEN = os.getenv("MAPBOX_ACCESS_TOKEN")
@@ -187,14 +633,17 @@ def _mapbox_get(url: str, params: dict):
         raise RuntimeError("MAPBOX_ACCESS_TOKEN is not set")
     clean = {k: v for k, v in params.items() if v is not None}
     clean["access_token"] = MAPBOX_TOKEN
-    r = requests.get(url, params=clean, timeout=30)
+    r = get_http().get(url, params=clean, timeout=30)
     r.raise_for_status()
     return r.json()
 
-def mapbox_geocode(query: str, limit: int = 1):
+def mapbox_geocode(query: str, limit: int = 1, proximity: list = None):
     encoded = urllib.parse.quote(query)
     url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{encoded}.json"
-    return _mapbox_get(url, {"limit": limit})
+    return _mapbox_get(url, {
+        "limit": limit,
+        "proximity": f"{proximity[0]},{proximity[1]}" if proximity else None,
+    })
 
 def mapbox_directions(profile: str, coordinates: list, alternatives: bool = False,
                       geometries: str = "geojson", overview: str = "full", steps: bool = True):
@@ -209,35 +658,574 @@ def mapbox_directions(profile: str, coordinates: list, alternatives: bool = Fals
         "steps": str(steps).lower(),
     })
 
+def mapbox_matrix(profile: str, coordinates: list, annotations: str = "duration"):
+    if not coordinates or len(coordinates) < 2:
+        raise ValueError("coordinates must have at least 2 [lon,lat] points")
+    coord_str = ";".join(f"{lon},{lat}" for lon, lat in coordinates)
+    url = f"https://api.mapbox.com/directions-matrix/v1/mapbox/{profile}/{coord_str}"
+    return _mapbox_get(url, {"annotations": annotations})
+
+# Multi-stop optimization: one matrix + one directions call per itinerary day
+MATRIX_MAX_COORDINATES = 25  # Mapbox Matrix/Directions waypoint limit for non-traffic profiles
+# Itinerary leg modes that map onto a Mapbox profile (bus/train legs keep Gemini's times)
+MODE_PROFILES = {"car": "driving", "drive": "driving", "driving": "driving",
+                 "walk": "walking", "walking": "walking", "bike": "cycling", "cycling": "cycling"}
+# A day is ordered with its main drivable mode: driving if any car leg, else cycling, else walking
+PRIMARY_PROFILES = ("driving", "cycling", "walking")
+# Walk/bike legs are timed from the routed distance at these speeds, and switch to
+# the day's main mode when the reordered hop is longer than is sensible on foot/bike
+MODE_SPEED_KMH = {"walking": 4.8, "cycling": 15}
+MODE_MAX_KM = {"walking": 3, "cycling": 15}
+# A stop further than this from the day's anchor is treated as a bad geocode
+MAX_STOP_DISTANCE_KM = {"driving": 300, "walking": 30, "cycling": 80}
+
+def _haversine_km(a: list, b: list) -> float:
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+def route_anchor(directions: dict) -> Optional[list]:
+    """Destination coordinates of a directions response, used to bias itinerary geocoding."""
+    waypoints = (directions or {}).get("waypoints") or []
+    return waypoints[-1].get("location") if waypoints else None
+
+def _path_cost(order: list, durations: "np.ndarray", closed: bool) -> float:
+    import numpy as np
+    idx = np.asarray(order)
+    cost = durations[idx[:-1], idx[1:]].sum()
+    if closed:
+        cost += durations[idx[-1], idx[0]]
+    return float(cost)
+
+def solve_visit_order(durations: "np.ndarray", closed: bool = False) -> list:
+    """
+    Heuristic TSP over a duration matrix: nearest neighbour from stop 0, then 2-opt
+    and Or-opt (relocating runs of 1-3 stops) until no move improves the tour.
+    Stop 0 stays first; with closed=True the tour returns to it at the end.
+    Costs are recomputed per candidate so asymmetric matrices are handled correctly.
+    """
+    import numpy as np
+
+    n = len(durations)
+    if n <= 2:
+        return list(range(n))
+    # Missing matrix cells (no route) come back as NaN/None – make them unattractive
+    d = np.where(np.isfinite(durations), durations, np.nanmax(durations[np.isfinite(durations)]) * 10 + 1)
+
+    order = [0]
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, d[order[-1]])
+        nxt = int(np.argmin(row))
+        order.append(nxt)
+        visited[nxt] = True
+
+    best = _path_cost(order, d, closed)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            for k in range(i + 1, n):
+                candidate = order[:i] + order[i:k + 1][::-1] + order[k + 1:]
+                cost = _path_cost(candidate, d, closed)
+                if cost < best - 1e-9:
+                    order, best = candidate, cost
+                    improved = True
+        # Or-opt: move runs of 1-3 stops (optionally reversed) elsewhere in the tour
+        for length in (1, 2, 3):
+            for i in range(1, n - length + 1):
+                segment = order[i:i + length]
+                rest = order[:i] + order[i + length:]
+                for j in range(1, len(rest) + 1):
+                    if j == i:
+                        continue
+                    for seg in (segment, segment[::-1]) if length > 1 else (segment,):
+                        candidate = rest[:j] + seg + rest[j:]
+                        cost = _path_cost(candidate, d, closed)
+                        if cost < best - 1e-9:
+                            order, best = candidate, cost
+                            improved = True
+                            break
+                    else:
+                        continue
+                    break
+    return order
+
+def _clock_minutes(value) -> Optional[int]:
+    try:
+        hours, minutes = str(value).split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except (ValueError, AttributeError):
+        return None
+
+def _minutes_clock(total: float) -> str:
+    total = int(round(total)) % (24 * 60)
+    return f"{total // 60:02d}:{total % 60:02d}"
+
+def optimize_itinerary_day(day: dict, geocode_cache: dict = None, anchor: list = None) -> dict:
+    """
+    Reorder a day's stops to minimise travel time and replace its legs with
+    Mapbox durations/distances from a single directions call in that order.
+    The order is solved with the day's main drivable mode (see PRIMARY_PROFILES);
+    each rebuilt leg keeps the mode Gemini gave it. Geocoding is biased to anchor
+    (the route context) for the first stop and to the first stop for the rest.
+    Returns the day unchanged if it has too few/many stops, no car/walk/bike leg,
+    or a stop can't be geocoded plausibly close by.
+    """
+    legs = day.get("legs") or []
+    leg_profiles = [MODE_PROFILES.get((leg.get("mode") or "").lower()) for leg in legs]
+    profile = next((p for p in PRIMARY_PROFILES if p in leg_profiles), None)
+    if profile is None:
+        return day
+    primary_mode = legs[leg_profiles.index(profile)]["mode"]
+    names = []
+    for leg in legs:
+        for end in ("from", "to"):
+            name = (leg.get(end) or {}).get("name")
+            if name and (not names or names[-1].lower() != name.lower()):
+                names.append(name)
+    closed = len(names) > 1 and names[0].lower() == names[-1].lower()
+    stops = []
+    for name in names[:-1] if closed else names:
+        if name.lower() not in (s.lower() for s in stops):
+            stops.append(name)
+    # A closed day sends its start twice to Directions, so it gets one stop fewer
+    if len(stops) < 3 or len(stops) > MATRIX_MAX_COORDINATES - (1 if closed else 0):
+        return day
+
+    geocode_cache = {} if geocode_cache is None else geocode_cache
+    coords = []
+    for name in stops:
+        bias = coords[0] if coords else anchor
+        key = (name.lower(), tuple(round(v, 2) for v in bias) if bias else None)
+        if key not in geocode_cache:
+            features = mapbox_geocode(name, proximity=bias).get("features") or []
+            geocode_cache[key] = features[0]["center"] if features else None
+        center = geocode_cache[key]
+        if center is None:
+            print(f"Stop optimization skipped for day {day.get('day')}: cannot geocode {name}")
+            return day
+        if coords and _haversine_km(coords[0], center) > MAX_STOP_DISTANCE_KM[profile]:
+            print(f"Stop optimization skipped for day {day.get('day')}: {name} geocoded implausibly far away")
+            return day
+        coords.append(center)
+
+    import numpy as np
+
+    matrix = mapbox_matrix(profile, coords)
+    durations = np.array(
+        [[np.nan if v is None else v for v in row] for row in matrix.get("durations", [])],
+        dtype=float,
+    )
+    order = solve_visit_order(durations, closed=closed)
+    if closed:
+        order = order + [0]
+
+    directions = mapbox_directions(profile, [coords[i] for i in order])
+    if not directions.get("routes"):
+        return day
+    route = directions["routes"][0]
+
+    # Keep Gemini's dwell time at each stop (next departure minus arrival) where it gave both
+    arrivals, departures = {}, {}
+    for leg in legs:
+        to_name = ((leg.get("to") or {}).get("name") or "").lower()
+        from_name = ((leg.get("from") or {}).get("name") or "").lower()
+        arrivals.setdefault(to_name, _clock_minutes((leg.get("to") or {}).get("time")))
+        departures.setdefault(from_name, _clock_minutes((leg.get("from") or {}).get("time")))
+    originals = {
+        (((leg.get("from") or {}).get("name") or "").lower(), ((leg.get("to") or {}).get("name") or "").lower()): leg
+        for leg in legs
+    }
+    departing_modes = {}
+    for leg in legs:
+        departing_modes.setdefault(((leg.get("from") or {}).get("name") or "").lower(), leg.get("mode"))
+
+    clock = _clock_minutes((legs[0].get("from") or {}).get("time"))
+    clock = 9 * 60 if clock is None else clock
+    new_legs = []
+    for (a, b), route_leg in zip(zip(order, order[1:]), route.get("legs", [])):
+        from_name, to_name = stops[a], stops[b]
+        if new_legs:
+            arrived, left = arrivals.get(from_name.lower()), departures.get(from_name.lower())
+            if arrived is not None and left is not None and left > arrived:
+                clock += left - arrived
+        original = originals.get((from_name.lower(), to_name.lower())) or {}
+        # Keep the leg's own mode: Gemini's for the same hop, else whatever Gemini used leaving this stop
+        leg_mode = original.get("mode") or departing_modes.get(from_name.lower()) or primary_mode
+        leg_profile = MODE_PROFILES.get(leg_mode.lower())
+        distance_km = route_leg.get("distance", 0) / 1000
+        if leg_profile in MODE_MAX_KM and leg_profile != profile and distance_km > MODE_MAX_KM[leg_profile]:
+            leg_mode, leg_profile = primary_mode, profile
+        if leg_profile == profile:
+            minutes = route_leg.get("duration", 0) / 60
+        elif leg_profile in MODE_SPEED_KMH:
+            minutes = distance_km / MODE_SPEED_KMH[leg_profile] * 60
+        elif original.get("duration_minutes") is not None:
+            minutes = float(original["duration_minutes"])  # bus/train: trust Gemini's time for the same hop
+        else:
+            minutes = route_leg.get("duration", 0) / 60
+        depart = clock
+        clock += minutes
+        new_legs.append({
+            "mode": leg_mode,
+            "from": {"name": from_name, "time": _minutes_clock(depart)},
+            "to": {"name": to_name, "time": _minutes_clock(clock)},
+            "duration_minutes": round(minutes, 1),
+            "distance_miles": round(route_leg.get("distance", 0) * 0.000621371, 1),
+            "description": original.get("description") or f"Travel from {from_name} to {to_name}",
+        })
+
+    optimized = dict(day)
+    optimized["legs"] = new_legs
+    optimized["stops"] = [{"name": stops[i], "coordinates": coords[i]} for i in order]
+    optimized["route"] = {
+        "duration_minutes": round(route.get("duration", 0) / 60, 1),
+        "distance_miles": round(route.get("distance", 0) * 0.000621371, 1),
+        "profile": profile,
+        "geometry": route.get("geometry"),
+        "reordered": order[:len(stops)] != list(range(len(stops))),
+    }
+    return optimized
+
+def optimize_itinerary_stops(itinerary: dict, anchor: list = None) -> dict:
+    """Run optimize_itinerary_day over every day and refresh the summary totals."""
+    if not MAPBOX_TOKEN or not itinerary.get("days"):
+        return itinerary
+    geocode_cache = {}
+    days = []
+    for day in itinerary["days"]:
+        try:
+            days.append(optimize_itinerary_day(day, geocode_cache, anchor))
+        except Exception as e:
+            print(f"Stop optimization error for day {day.get('day')}: {e}")
+            days.append(day)
+    result = dict(itinerary)
+    result["days"] = days
+    if all(new is old for new, old in zip(days, itinerary["days"])):
+        return result
+    summary = dict(result.get("summary") or {})
+    all_legs = [leg for day in days for leg in day.get("legs", [])]
+    summary["total_duration_minutes"] = round(sum(leg.get("duration_minutes") or 0 for leg in all_legs), 1)
+    summary["total_distance_miles"] = round(sum(leg.get("distance_miles") or 0 for leg in all_legs), 1)
+    result["summary"] = summary
+    return result
+
+# Trip store (SQLite) – every route and itinerary is kept, not just the latest
+TRIPS_DB_PATH = os.getenv("TRIPS_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "trips.db"))
+_trips_db = None
+# One shared connection; every execute/commit/fetch goes through this lock
+_trips_lock = threading.Lock()
+
+def _get_trips_db():
+    global _trips_db
+    if _trips_db is None:
+        with _init_lock:
+            if _trips_db is None:
+                _trips_db = _timed_init("trips_db", _open_trips_db)
+    return _trips_db
+
+def _open_trips_db():
+    db = sqlite3.connect(TRIPS_DB_PATH, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS trips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            kind TEXT NOT NULL,
+            origin TEXT COLLATE NOCASE,
+            destination TEXT COLLATE NOCASE,
+            duration_minutes REAL,
+            distance_miles REAL,
+            created_at TEXT NOT NULL,
+            payload BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_trips_session ON trips (session_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_trips_od ON trips (origin, destination, created_at);
+        CREATE INDEX IF NOT EXISTS idx_trips_created ON trips (created_at);
+    """)
+    return db
+
+def _encode_polyline(coordinates: list, precision: int = 6) -> str:
+    """Encode [lon, lat] pairs with the polyline algorithm (Mapbox polyline6 by default)."""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lon, lat in coordinates:
+        lat_i, lon_i = int(round(lat * factor)), int(round(lon * factor))
+        for delta in (lat_i - prev_lat, lon_i - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                out.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            out.append(chr(value + 63))
+        prev_lat, prev_lon = lat_i, lon_i
+    return "".join(out)
+
+def _decode_polyline(encoded: str, precision: int = 6) -> list:
+    factor = 10 ** precision
+    coordinates = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coordinates.append([lon / factor, lat / factor])
+    return coordinates
+
+def _map_geometries(obj, fn):
+    """Apply fn to every LineString geometry in a directions response (routes and steps)."""
+    if isinstance(obj, dict):
+        return {
+            k: fn(v) if k == "geometry" and isinstance(v, dict) else _map_geometries(v, fn)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, list):
+        return [_map_geometries(v, fn) for v in obj]
+    return obj
+
+def _pack_geometry(geometry: dict) -> dict:
+    if geometry.get("type") != "LineString":
+        return geometry
+    return {"type": "LineString", "polyline6": _encode_polyline(geometry.get("coordinates", []))}
+
+def _unpack_geometry(geometry: dict) -> dict:
+    if "polyline6" not in geometry:
+        return geometry
+    return {"type": "LineString", "coordinates": _decode_polyline(geometry["polyline6"])}
+
+def compress_trip_payload(payload: dict) -> bytes:
+    packed = _map_geometries(payload, _pack_geometry)
+    return zlib.compress(json.dumps(packed, separators=(",", ":")).encode("utf-8"))
+
+def decompress_trip_payload(blob: bytes) -> dict:
+    return _map_geometries(json.loads(zlib.decompress(blob).decode("utf-8")), _unpack_geometry)
+
+def save_trip(kind: str, payload: dict, session_id: str = None, origin: str = None,
+              destination: str = None, duration_minutes: float = None, distance_miles: float = None) -> int:
+    db = _get_trips_db()
+    blob = compress_trip_payload(payload)
+    with _trips_lock:
+        cur = db.execute(
+            "INSERT INTO trips (session_id, kind, origin, destination, duration_minutes, distance_miles, created_at, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (session_id, kind, origin, destination, duration_minutes, distance_miles,
+             datetime.utcnow().isoformat(), blob),
+        )
+        db.commit()
+        return cur.lastrowid
+
+def list_trips(session_id: str = None, origin: str = None, destination: str = None, kind: str = None,
+               since: str = None, until: str = None, limit: int = 20, offset: int = 0) -> list:
+    clauses, params = [], []
+    for column, value in (("session_id", session_id), ("origin", origin),
+                          ("destination", destination), ("kind", kind)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("created_at < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    db = _get_trips_db()
+    with _trips_lock:
+        rows = db.execute(
+            "SELECT id, kind, origin, destination, duration_minutes, distance_miles, created_at "
+            f"FROM trips {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def get_trip(trip_id: int, session_id: str = None) -> Optional[dict]:
+    """Fetch one trip; with session_id, only if it belongs to that session. session_id is never returned."""
+    query, params = "SELECT * FROM trips WHERE id = ?", [trip_id]
+    if session_id is not None:
+        query += " AND session_id = ?"
+        params.append(session_id)
+    db = _get_trips_db()
+    with _trips_lock:
+        row = db.execute(query, params).fetchone()
+    if row is None:
+        return None
+    trip = dict(row)
+    trip.pop("session_id", None)
+    trip["payload"] = decompress_trip_payload(trip["payload"])
+    return trip
+
 # Remove REST forwarder entirely – we handle travel inline in WebSocket
 
 # Single-process only – no subprocess/thread spawn
 
+# Readiness + optional background warm-up (WARMUP_ON_STARTUP=1)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
+_warmup = {"state": "running" if WARMUP_ON_STARTUP else "disabled", "error": None}
+_restored_latest = {}
+
+def _load_latest_trips():
+    """
+    Read the newest stored route/itinerary so /route/latest and /itinerary/latest
+    survive restarts. Kept apart from the live and per-session state, so a
+    restored route never answers another user's follow-ups.
+    """
+    global _restored_latest
+    restored = {}
+    latest = list_trips(kind="route", limit=1)
+    if latest:
+        restored["route"] = get_trip(latest[0]["id"])["payload"]
+    latest = list_trips(kind="itinerary", limit=1)
+    if latest:
+        restored["itinerary"] = get_trip(latest[0]["id"])["payload"]
+    _restored_latest = restored
+
+def warm_up():
+    """Initialize the lazy clients ahead of the first request."""
+    try:
+        get_model()
+        http = get_http()
+        try:
+            # Pre-open a keep-alive connection to Mapbox
+            http.head("https://api.mapbox.com", timeout=5)
+        except Exception as e:
+            print(f"Mapbox pre-connect failed: {e}")
+        _timed_init("trip_cache", _load_latest_trips)
+        _warmup["state"] = "done"
+    except Exception as e:
+        print(f"Warm-up error: {e}")
+        _warmup.update(state="failed", error=str(e))
+
+def _direct_imports(importtime_stderr: str, module: str = "main") -> list:
+    """
+    Parse `-X importtime` output into (cumulative_us, self_us, name) for the
+    modules imported directly by `module`. Children are printed before their
+    parent, two spaces deeper per level, so the direct imports are the lines
+    one level deeper than `module` since the last line at its own depth.
+    """
+    rows = []
+    for line in importtime_stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name_field = line.replace("import time:", "|", 1).split("|")
+        name = name_field.strip()
+        depth = (len(name_field) - len(name_field.lstrip()) - 1) // 2
+        rows.append((int(cumulative_us), int(self_us), name, depth))
+    parent = next((i for i, r in enumerate(rows) if r[2] == module), None)
+    if parent is None:
+        return []
+    parent_depth = rows[parent][3]
+    direct = []
+    for cumulative_us, self_us, name, depth in reversed(rows[:parent]):
+        if depth <= parent_depth:
+            break
+        if depth == parent_depth + 1:
+            direct.append((cumulative_us, self_us, name))
+    return [rows[parent][:3]] + direct
+
+def import_time_report(top: int = 15) -> str:
+    """Run `python -X importtime -c "import main"` in a fresh interpreter and summarise main's direct imports."""
+    import subprocess
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True,
+    )
+    rows = _direct_imports(proc.stderr)
+    if not rows or proc.returncode != 0:
+        return "main failed to import:\n" + proc.stderr[-2000:]
+    lines = [f"Total import of main: {rows[0][0] / 1000:.1f} ms (self {rows[0][1] / 1000:.1f} ms)"]
+    lines.append(f"{'cumulative ms':>14} {'self ms':>9}  direct import")
+    for cumulative_us, self_us, name in sorted(rows[1:], reverse=True)[:top]:
+        lines.append(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    return "\n".join(lines)
+
 # FastAPI Routes
 @app.get("/")
 async def root():
     return {"message": "Fetch.ai Chat Agent + WebSocket Server Ready!"}
 
+@app.get("/ready")
+async def ready():
+    """200 once warm-up is done (or disabled); 503 while it runs or if it failed."""
+    body = {
+        "ready": _warmup["state"] in ("disabled", "done"),
+        "warmup": _warmup,
+        "module_load_ms": MODULE_LOAD_MS,
+        "initialized_ms": dict(_init_timings),
+    }
+    if not body["ready"]:
+        from fastapi.responses import JSONResponse
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 @app.get("/route/latest")
 async def get_latest_route():
-    if last_directions_json is None:
+    latest = last_directions_json if last_directions_json is not None else _restored_latest.get("route")
+    if latest is None:
         from fastapi import Response
         return Response(status_code=204)
-    return last_directions_json
+    return latest
 
 @app.get("/itinerary/latest")
 async def get_latest_itinerary():
-    if last_itinerary_json is None:
+    latest = last_itinerary_json if last_itinerary_json is not None else _restored_latest.get("itinerary")
+    if latest is None:
         from fastapi import Response
         return Response(status_code=204)
-    print(f"Returning itinerary with {len(last_itinerary_json.get('days', []))} days")
-    return last_itinerary_json
+    print(f"Returning itinerary with {len(latest.get('days', []))} days")
+    return latest
+
+@app.get("/trips")
+async def get_trips(session_id: str, origin: Optional[str] = None,
+                    destination: Optional[str] = None, kind: Optional[str] = None,
+                    since: Optional[str] = None, until: Optional[str] = None,
+                    limit: int = 20, offset: int = 0):
+    # session_id is required so one client can't list another's trips
+    if not is_valid_session_id(session_id):
+        raise HTTPException(status_code=403, detail="invalid session")
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    trips = list_trips(session_id, origin, destination, kind, since, until, limit, offset)
+    return {
+        "trips": trips,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if len(trips) == limit else None,
+    }
+
+@app.get("/trips/{trip_id}")
+async def get_trip_by_id(trip_id: int, session_id: str):
+    if not is_valid_session_id(session_id):
+        raise HTTPException(status_code=403, detail="invalid session")
+    trip = get_trip(trip_id, session_id)
+    if trip is None:
+        raise HTTPException(status_code=404, detail="trip not found")
+    return trip
 
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time chat"""
     await websocket.accept()
-    print("WebSocket connected!")
+    # Resume a server-issued session if the client passes one back, otherwise issue a new one.
+    # The id is only ever sent to this client, in this first message.
+    requested = websocket.query_params.get("session_id")
+    resumed = is_valid_session_id(requested)
+    session_id = requested if resumed else issue_session_id()
+    await websocket.send_text(json.dumps({"type": "session", "session_id": session_id, "resumed": resumed}))
+    print(f"WebSocket connected! ({'resumed' if resumed else 'new'} session)")
     
     try:
         while True:
@@ -245,6 +1233,8 @@ async def websocket_endpoint(websocket: WebSocket):
             data = await websocket.receive_text()
             message_data = json.loads(data)
             user_message = message_data.get("message", "")
+            touch_session(session_id)
+            route_state = get_session_route(session_id)
             
             print(f"Received: {user_message}")
             
@@ -253,9 +1243,9 @@ async def websocket_endpoint(websocket: WebSocket):
                 print(f"🌍 Travel question detected: {user_message}")
                 try:
                     # Use Gemini to extract origin and destination without regex
-                    extraction = model.generate_content(
+                    extraction = get_model().generate_content(
                         f"Extract origin and destination from this message as JSON with keys origin and destination only. No prose, only JSON. Message: {user_message}",
-                        generation_config=genai.types.GenerationConfig(
+                        generation_config=get_genai().types.GenerationConfig(
                             temperature=0.0,
                             max_output_tokens=200,
                             response_mime_type="application/json"
@@ -301,6 +1291,7 @@ async def websocket_endpoint(websocket: WebSocket):
                     print("Mapbox directions JSON:", directions)
                     global last_directions_json
                     last_directions_json = directions
+                    route_state["directions"] = directions
                     
                     # Extract route information from JSON
                     if directions.get("routes") and len(directions["routes"]) > 0:
@@ -315,12 +1306,17 @@ async def websocket_endpoint(websocket: WebSocket):
 🚗 Driving route available"""
                         # remember summary for follow-ups
                         global last_route_summary
-                        last_route_summary = {
+                        last_route_summary = route_state["summary"] = {
                             "origin": origin,
                             "destination": destination,
                             "duration_minutes": round(duration, 1),
                             "distance_miles": round(distance, 1),
                         }
+                        try:
+                            save_trip("route", directions, session_id, origin, destination,
+                                      last_route_summary["duration_minutes"], last_route_summary["distance_miles"])
+                        except Exception as e:
+                            print(f"Trip store error: {e}")
                     else:
                         response = "No route found between these locations"
                 except Exception as e:
@@ -328,24 +1324,11 @@ async def websocket_endpoint(websocket: WebSocket):
                     response = f"{e}"
             elif is_itinerary_question(user_message):
                 try:
-                    # Build compact transcript for context
-                    transcript_lines = []
-                    for t in conversation_history[-10:]:
-                        role = t.get("role", "user").upper()
-                        content = t.get("content", "")
-                        transcript_lines.append(f"{role}: {content}")
-                    context_blob = "\n".join(transcript_lines)
-
-                    # Include route summary if available
+                    # Token-budgeted transcript + compact route reference
+                    context_blob = build_context(session_id)
                     route_context = ""
-                    if last_route_summary:
-                        route_context = (
-                            f"\n\nAvailable Route Information:\n"
-                            f"- Origin: {last_route_summary['origin']}\n"
-                            f"- Destination: {last_route_summary['destination']}\n"
-                            f"- Duration: {last_route_summary['duration_minutes']} minutes\n"
-                            f"- Distance: {last_route_summary['distance_miles']} miles"
-                        )
+                    if route_state["summary"]:
+                        route_context = f"\n\nAvailable Route Information: {route_reference(session_id)}"
 
                     prompt = (
                         "You are a travel planner. Create a detailed multi-day travel itinerary in JSON format.\n\n"
@@ -431,9 +1414,9 @@ async def websocket_endpoint(websocket: WebSocket):
                     )
 
                     try:
-                        gemini_response = model.generate_content(
+                        gemini_response = get_model().generate_content(
                             prompt,
-                            generation_config=genai.types.GenerationConfig(
+                            generation_config=get_genai().types.GenerationConfig(
                                 temperature=0.3,
                                 max_output_tokens=4000,
                                 response_mime_type="application/json",
@@ -517,17 +1500,18 @@ async def websocket_endpoint(websocket: WebSocket):
                         
                         # Create fallback days
                         fallback_days = []
+                        route_summary = route_state["summary"]
                         for day_num in range(1, num_days + 1):
                             # Create sample activities for each day
-                            if last_route_summary and day_num == 1:
+                            if route_summary and day_num == 1:
                                 legs = [
                                     {
                                         "mode": "car",
-                                        "from": {"name": last_route_summary['origin'], "time": "09:00"},
-                                        "to": {"name": last_route_summary['destination'], "time": "12:00"},
-                                        "duration_minutes": last_route_summary['duration_minutes'],
-                                        "distance_miles": last_route_summary['distance_miles'],
-                                        "description": f"Drive from {last_route_summary['origin']} to {last_route_summary['destination']}"
+                                        "from": {"name": route_summary['origin'], "time": "09:00"},
+                                        "to": {"name": route_summary['destination'], "time": "12:00"},
+                                        "duration_minutes": route_summary['duration_minutes'],
+                                        "distance_miles": route_summary['distance_miles'],
+                                        "description": f"Drive from {route_summary['origin']} to {route_summary['destination']}"
                                     },
                                     {
                                         "mode": "walk",
@@ -558,7 +1542,6 @@ async def websocket_endpoint(websocket: WebSocket):
                                     }
                                 ]
                             
-                            from datetime import timedelta
                             day_date = (datetime.utcnow() + timedelta(days=day_num-1)).strftime("%Y-%m-%d")
                             
                             fallback_days.append({
@@ -583,32 +1566,38 @@ async def websocket_endpoint(websocket: WebSocket):
                         }
                         print(f"Created fallback with {len(fallback_days)} days")
                     
+                    # Reorder each day's stops using one Mapbox matrix + directions call per day
+                    parsed = optimize_itinerary_stops(parsed, route_anchor(route_state["directions"]))
+
                     global last_itinerary_json
-                    last_itinerary_json = parsed
+                    last_itinerary_json = route_state["itinerary"] = parsed
                     print(f"Stored itinerary JSON: {last_itinerary_json}")
+                    try:
+                        all_legs = [leg for day in parsed.get("days", []) for leg in day.get("legs", [])]
+                        summary = parsed.get("summary") or {}
+                        save_trip(
+                            "itinerary", parsed, session_id,
+                            (all_legs[0].get("from") or {}).get("name") if all_legs else None,
+                            (all_legs[-1].get("to") or {}).get("name") if all_legs else None,
+                            summary.get("total_duration_minutes"),
+                            summary.get("total_distance_miles"),
+                        )
+                    except Exception as e:
+                        print(f"Trip store error: {e}")
                     response = "just created the itinerary."
                 except Exception as e:
                     print("Itinerary handling error:", e)
                     response = f"{e}"
+            elif (followup_answer := answer_route_followup(user_message, session_id)) is not None:
+                # Answered locally from the cached route, no Gemini round-trip
+                response = followup_answer
             else:
                 # Regular Gemini response for non-travel questions
                 try:
-                    # Build compact inline transcript + optional last route summary
-                    transcript_lines = []
-                    for t in conversation_history[-10:]:
-                        role = t.get("role", "user").upper()
-                        content = t.get("content", "")
-                        transcript_lines.append(f"{role}: {content}")
-                    context_blob = "\n".join(transcript_lines)
-
-                    route_hint = ""
-                    if last_route_summary:
-                        route_hint = (
-                            f"\nLastRoute: origin={last_route_summary['origin']}, "
-                            f"destination={last_route_summary['destination']}, "
-                            f"duration_minutes={last_route_summary['duration_minutes']}, "
-                            f"distance_miles={last_route_summary['distance_miles']}"
-                        )
+                    # Token-budgeted transcript + compact references to the latest route/itinerary
+                    context_blob = build_context(session_id)
+                    refs = " ".join(r for r in (route_reference(session_id), itinerary_reference(session_id)) if r)
+                    route_hint = f"\nKnown: {refs}" if refs else ""
 
                     prompt = (
                         "You are a helpful assistant. Use the recent transcript to maintain context.\n" \
@@ -616,9 +1605,9 @@ async def websocket_endpoint(websocket: WebSocket):
                         f"USER: {user_message}\nASSISTANT:"
                     )
 
-                    gemini_response = model.generate_content(
+                    gemini_response = get_model().generate_content(
                         prompt,
-                        generation_config=genai.types.GenerationConfig(
+                        generation_config=get_genai().types.GenerationConfig(
                             temperature=0.7,
                             max_output_tokens=1000,
                         )
@@ -642,19 +1631,25 @@ async def websocket_endpoint(websocket: WebSocket):
             }
             
             await websocket.send_text(json.dumps(response_data))
-            # Record assistant reply into conversation history to keep context
-            conversation_history.append({"role": "assistant", "content": response})
+            # Record both sides of the exchange into this session's history
+            history = get_session_history(session_id)
+            history.append({"role": "user", "content": user_message})
+            history.append({"role": "assistant", "content": response})
             
     except WebSocketDisconnect:
         print("WebSocket disconnected")
     except Exception as e:
         print(f"WebSocket error: {e}")
 
+MODULE_LOAD_MS = round((time.perf_counter() - _MODULE_LOAD_STARTED) * 1000, 1)
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == "--run-agent":
+    if len(sys.argv) > 1 and sys.argv[1] == "--profile-imports":
+        print(import_time_report())
+    elif len(sys.argv) > 1 and sys.argv[1] == "--run-agent":
         # Run only the chat_agent (serves /forward on :5050)
         print("Starting chat_agent on http://127.0.0.1:5050")
-        chat_agent.run()
+        get_chat_agent().run()
     else:
         import uvicorn
         print("Starting Fetch.ai Chat Agent + WebSocket Server on http://localhost:8000")
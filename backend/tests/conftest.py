@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# main.py lives one level up and reads TRIPS_DB_PATH at import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("TRIPS_DB_PATH", os.path.join(tempfile.mkdtemp(), "trips.db"))
@@ -0,0 +1,93 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def clean_sessions():
+    yield
+    for sid in list(main._session_last_seen):
+        main.drop_session(sid)
+    main.session_histories.clear()
+    main._session_summaries.clear()
+
+
+def _fill(session_id, turns, answer_words=400):
+    history = main.get_session_history(session_id)
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}? Some more words here."})
+        history.append({"role": "assistant", "content": f"Long answer {i}. " + "blah " * answer_words})
+
+
+def test_build_context_stays_within_budget():
+    for _ in range(20):
+        _fill("ctx", 2)
+        context = main.build_context("ctx", budget=600)
+        assert main.estimate_tokens(context) <= 600
+
+
+def test_build_context_folds_old_turns_into_summary_once():
+    _fill("ctx", 10)
+    context = main.build_context("ctx", budget=600)
+    assert "Earlier (summary):" in context
+    assert "USER: Question 0?" in context
+    summary = list(main._session_summaries["ctx"])
+    # Evicted turns are gone from the history, so a second build doesn't re-summarise them
+    remaining = len(main.get_session_history("ctx"))
+    main.build_context("ctx", budget=600)
+    assert main._session_summaries["ctx"] == summary
+    assert len(main.get_session_history("ctx")) == remaining
+
+
+def test_build_context_keeps_short_history_verbatim():
+    _fill("ctx", 2, answer_words=5)
+    context = main.build_context("ctx", budget=600)
+    assert "Earlier (summary):" not in context
+    assert context.count("ASSISTANT: Long answer") == 2
+
+
+def test_structured_turns_are_omitted_from_summary():
+    assert main._compact_turn({"role": "assistant", "content": '{"days": []}'}) == "ASSISTANT: [structured data omitted]"
+
+
+def test_sessions_are_bounded(monkeypatch):
+    monkeypatch.setattr(main, "MAX_SESSIONS", 3)
+    for sid in ("a", "b", "c", "d"):
+        main.get_session_history(sid).append({"role": "user", "content": sid})
+        main.touch_session(sid)
+    assert "a" not in main.session_histories
+    assert set(main._session_last_seen) == {"b", "c", "d"}
+
+
+def test_idle_sessions_expire(monkeypatch):
+    main.get_session_history("old").append({"role": "user", "content": "hi"})
+    main.touch_session("old")
+    main._session_last_seen["old"] -= main.SESSION_TTL_SECONDS + 1
+    main.touch_session("new")
+    assert "old" not in main.session_histories
+
+
+def test_session_ids_are_signed():
+    session_id = main.issue_session_id()
+    assert main.is_valid_session_id(session_id)
+    token, _, signature = session_id.rpartition(".")
+    assert not main.is_valid_session_id(f"{token}.{'0' * len(signature)}")
+    assert not main.is_valid_session_id("my-session")
+    assert not main.is_valid_session_id("")
+    assert not main.is_valid_session_id(None)
+
+
+def test_websocket_issues_and_resumes_sessions():
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/chat") as ws:
+        first = ws.receive_json()
+    assert first["type"] == "session" and first["resumed"] is False
+    assert main.is_valid_session_id(first["session_id"])
+
+    with client.websocket_connect(f"/ws/chat?session_id={first['session_id']}") as ws:
+        assert ws.receive_json() == {"type": "session", "session_id": first["session_id"], "resumed": True}
+
+    with client.websocket_connect("/ws/chat?session_id=guessed") as ws:
+        issued = ws.receive_json()
+    assert issued["resumed"] is False and issued["session_id"] != "guessed"
@@ -0,0 +1,100 @@
+from datetime import datetime
+
+import pytest
+
+import main
+
+ROUTE = {
+    "routes": [{
+        "duration": 3600,
+        "distance": 50000,
+        "legs": [{
+            "duration": 3600,
+            "distance": 50000,
+            "summary": "US-101 S",
+            "steps": [
+                {"distance": 200, "duration": 60, "maneuver": {"instruction": "Head north on Market St"}},
+                {"distance": 49800, "duration": 3540, "maneuver": {"instruction": "Merge onto US-101 S"}},
+            ],
+        }],
+    }]
+}
+
+
+@pytest.fixture(autouse=True)
+def cached_route(monkeypatch):
+    monkeypatch.setitem(main.session_routes, None, {
+        "directions": ROUTE,
+        "summary": {"origin": "SF", "destination": "San Jose"},
+        "itinerary": None,
+    })
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("how long will that take?", "takes about 1 h"),
+    ("How far is it in km?", "50.0 km"),
+    ("how far is it to San Jose?", "31.1 miles"),
+    ("how long does it take to drive from sf to san jose", "takes about 1 h"),
+    ("how long will it take to get there by car?", "takes about 1 h"),
+    ("what's the distance of the drive", "31.1 miles"),
+    ("what's step 2 of the route", "Step 2: Merge onto US-101 S"),
+    ("what's the last turn on the route", "Step 2: Merge onto US-101 S"),
+    ("how long is the first leg of the trip", "Leg 1 via US-101 S"),
+    ("how many steps are in the route", "2 steps"),
+    ("list the directions", "1. Head north on Market St"),
+    ("if I leave at 5pm when will I get there", "arrive around 6:00 PM"),
+    ("what time should I leave to get there by 9:30 am", "leave by 8:30 AM"),
+])
+def test_answers_route_followups(question, expected):
+    assert expected in main.answer_route_followup(question)
+
+
+@pytest.mark.parametrize("question", [
+    "how far is Paris from Berlin?",
+    "what is the distance to the moon?",
+    "how long should I boil an egg?",
+    "What restaurant should I visit when I arrive?",
+    "how do I reach customer support",
+    "what is the first step of a marathon training plan",
+    "show me the steps to reset my password",
+    "how long is the drive from Paris to Berlin?",
+    "how long does it take to cook pasta?",
+    "How far is it to the moon?",
+    "how long did it take to build the Golden Gate bridge?",
+    "how long should I stay there?",
+    "how long will it take by bike?",
+    "how long does it take to drive from san jose to la",
+    "tell me a joke",
+])
+def test_leaves_unrelated_questions_to_gemini(question):
+    assert main.answer_route_followup(question) is None
+
+
+def test_no_cached_route():
+    assert main.answer_route_followup("how long will that take?", session_id="fresh-session") is None
+    main.session_routes.pop("fresh-session", None)
+
+
+def test_latest_route_from_another_session_is_not_used(monkeypatch):
+    monkeypatch.setattr(main, "last_directions_json", ROUTE)
+    monkeypatch.setattr(main, "_restored_latest", {"route": ROUTE})
+    assert main.answer_route_followup("how long will that take?", session_id="other-session") is None
+    main.session_routes.pop("other-session", None)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("leave at 5pm", (17, 0)),
+    ("at 5:30 p.m.", (17, 30)),
+    ("at 12 am", (0, 0)),
+    ("by 17:45", (17, 45)),
+    ("around noon", (12, 0)),
+])
+def test_parse_clock(text, expected):
+    parsed = main._parse_clock(text, datetime(2025, 1, 1, 8, 0))
+    assert (parsed.hour, parsed.minute) == expected
+
+
+def test_parse_clock_rejects_invalid():
+    now = datetime(2025, 1, 1, 8, 0)
+    assert main._parse_clock("at 13pm", now) is None
+    assert main._parse_clock("5 miles", now) is None
@@ -0,0 +1,143 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import main
+
+# Stops on a line, x in km-ish units; durations are |dx| * 60 seconds
+POINTS = {"hotel": [0.0, 0.0], "a": [0.10, 0.0], "b": [0.01, 0.0], "c": [0.09, 0.0], "d": [0.02, 0.0]}
+
+
+def _brute_force(durations, closed):
+    n = len(durations)
+    return min(
+        main._path_cost([0, *perm], durations, closed)
+        for perm in itertools.permutations(range(1, n))
+    )
+
+
+@pytest.mark.parametrize("closed", [False, True])
+def test_solve_visit_order_close_to_brute_force(closed):
+    # Heuristic: usually optimal, never far off on small Euclidean instances
+    rng = np.random.default_rng(42)
+    ratios = []
+    for _ in range(50):
+        points = rng.random((7, 2)) * 100
+        durations = np.linalg.norm(points[:, None] - points[None, :], axis=-1)
+        order = main.solve_visit_order(durations, closed=closed)
+        assert order[0] == 0 and sorted(order) == list(range(7))
+        ratios.append(main._path_cost(order, durations, closed) / _brute_force(durations, closed))
+    assert max(ratios) < 1.15
+    assert sum(r < 1 + 1e-9 for r in ratios) >= 45
+
+
+def test_solve_visit_order_handles_missing_cells():
+    durations = np.array([[0, 1, np.nan], [1, 0, 1], [5, 1, 0]], dtype=float)
+    assert main.solve_visit_order(durations) == [0, 1, 2]
+
+
+@pytest.fixture
+def fake_mapbox(monkeypatch):
+    calls = {"geocode": [], "directions": []}
+
+    def geocode(name, limit=1, proximity=None):
+        calls["geocode"].append((name, proximity))
+        center = POINTS.get(name.lower())
+        return {"features": [{"center": center}] if center else []}
+
+    def matrix(profile, coords):
+        return {"durations": [[abs(a[0] - b[0]) * 6000 for b in coords] for a in coords]}
+
+    def directions(profile, coords):
+        calls["directions"].append((profile, coords))
+        legs = [{"duration": abs(a[0] - b[0]) * 6000, "distance": abs(a[0] - b[0]) * 100000}
+                for a, b in zip(coords, coords[1:])]
+        return {"routes": [{"duration": sum(l["duration"] for l in legs),
+                            "distance": sum(l["distance"] for l in legs), "geometry": {}, "legs": legs}]}
+
+    monkeypatch.setattr(main, "MAPBOX_TOKEN", "test")
+    monkeypatch.setattr(main, "mapbox_geocode", geocode)
+    monkeypatch.setattr(main, "mapbox_matrix", matrix)
+    monkeypatch.setattr(main, "mapbox_directions", directions)
+    return calls
+
+
+def _day(stops, mode="walk"):
+    return {"day": 1, "legs": [
+        {"mode": mode, "from": {"name": a, "time": f"{9 + i:02d}:00"}, "to": {"name": b, "time": f"{9 + i:02d}:10"}}
+        for i, (a, b) in enumerate(zip(stops, stops[1:]))
+    ]}
+
+
+def test_optimize_day_reorders_and_keeps_mode(fake_mapbox):
+    day = main.optimize_itinerary_day(_day(["Hotel", "A", "B", "C", "D", "Hotel"]))
+    assert [s["name"] for s in day["stops"]] in (
+        ["Hotel", "B", "D", "C", "A", "Hotel"], ["Hotel", "A", "C", "D", "B", "Hotel"])
+    assert {leg["mode"] for leg in day["legs"]} == {"walk"}
+    assert day["route"]["profile"] == "walking"
+    assert fake_mapbox["directions"][0][0] == "walking"
+    # Stops after the first are geocoded near the first one
+    assert all(prox == POINTS["hotel"] for _, prox in fake_mapbox["geocode"][1:])
+
+
+def test_optimize_day_skips_transit_only_days(fake_mapbox):
+    train = _day(["Hotel", "A", "B", "C"], mode="train")
+    assert main.optimize_itinerary_day(train) is train
+    assert not fake_mapbox["directions"]
+
+
+def test_optimize_mixed_mode_day_like_gemini_output(fake_mapbox):
+    # Same shape as the itinerary prompt's example: car, walk, car, bus legs with times and descriptions
+    day = {"day": 1, "date": "2025-10-20", "title": "Day 1", "legs": [
+        {"mode": "car", "from": {"name": "Hotel", "time": "08:00"}, "to": {"name": "A", "time": "08:10"},
+         "duration_minutes": 10, "distance_miles": 6, "description": "Drive to A"},
+        {"mode": "walk", "from": {"name": "A", "time": "10:00"}, "to": {"name": "B", "time": "10:20"},
+         "duration_minutes": 20, "distance_miles": 0.8, "description": "Walk to B"},
+        {"mode": "car", "from": {"name": "B", "time": "12:00"}, "to": {"name": "C", "time": "12:10"},
+         "duration_minutes": 10, "distance_miles": 5, "description": "Drive to C"},
+        {"mode": "bus", "from": {"name": "C", "time": "14:00"}, "to": {"name": "D", "time": "14:30"},
+         "duration_minutes": 30, "distance_miles": 4, "description": "Bus to D"},
+    ]}
+    optimized = main.optimize_itinerary_day(day)
+    assert optimized is not day
+    assert optimized["route"]["profile"] == "driving"
+    assert len(fake_mapbox["directions"]) == 1 and fake_mapbox["directions"][0][0] == "driving"
+    # Hotel, B, D, C, A is the shortest order along the line
+    assert [s["name"] for s in optimized["stops"]] == ["Hotel", "B", "D", "C", "A"]
+    # New hops take the mode Gemini used leaving that stop (C left by bus), else the main mode
+    assert [leg["mode"] for leg in optimized["legs"]] == ["car", "car", "car", "bus"]
+    assert [leg["description"] for leg in optimized["legs"]][0] == "Travel from Hotel to B"
+
+
+def test_rebuilt_legs_keep_their_own_mode(fake_mapbox):
+    day = {"day": 1, "legs": [
+        {"mode": "car", "from": {"name": "Hotel", "time": "09:00"}, "to": {"name": "B", "time": "09:05"}},
+        {"mode": "walk", "from": {"name": "B", "time": "10:00"}, "to": {"name": "D", "time": "10:10"}},
+        {"mode": "car", "from": {"name": "D", "time": "11:00"}, "to": {"name": "A", "time": "11:10"}},
+        {"mode": "car", "from": {"name": "A", "time": "12:00"}, "to": {"name": "C", "time": "12:05"}},
+    ]}
+    optimized = main.optimize_itinerary_day(day)
+    legs = {(leg["from"]["name"], leg["to"]["name"]): leg for leg in optimized["legs"]}
+    walk = legs[("B", "D")]
+    assert walk["mode"] == "walk"
+    # 1 km at walking pace, not the driving duration from the matrix
+    assert walk["duration_minutes"] == pytest.approx(1 / main.MODE_SPEED_KMH["walking"] * 60, abs=0.1)
+    assert legs[("Hotel", "B")]["mode"] == "car"
+
+
+def test_optimize_day_skips_implausibly_far_stop(fake_mapbox, monkeypatch):
+    monkeypatch.setitem(POINTS, "c", [150.0, 0.0])
+    day = _day(["Hotel", "A", "B", "C"])
+    assert main.optimize_itinerary_day(day) is day
+
+
+def test_closed_day_respects_waypoint_limit(fake_mapbox, monkeypatch):
+    names = [f"Stop {i}" for i in range(main.MATRIX_MAX_COORDINATES)]
+    for i, name in enumerate(names):
+        monkeypatch.setitem(POINTS, name.lower(), [i * 0.001, 0.0])
+    closed = _day(names + [names[0]], mode="car")
+    assert main.optimize_itinerary_day(closed) is closed
+    opened = _day(names, mode="car")
+    assert main.optimize_itinerary_day(opened) is not opened
+    assert len(fake_mapbox["directions"][0][1]) == main.MATRIX_MAX_COORDINATES
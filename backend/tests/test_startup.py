@@ -0,0 +1,61 @@
+import subprocess
+import sys
+import warnings
+
+from fastapi.testclient import TestClient
+
+import main
+
+# `-X importtime` prints children before parents, two extra spaces per level
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |       _json
+import time:       300 |        400 |     json.decoder
+import time:       200 |        600 |   json
+import time:       500 |        500 |       enum
+import time:        50 |        550 |     re
+import time:        80 |        630 |   fastapi
+import time:      1000 |       2230 | main
+"""
+
+
+def test_direct_imports_uses_indentation_depth():
+    rows = main._direct_imports(IMPORTTIME)
+    assert rows[0] == (2230, 1000, "main")
+    assert sorted(name for _, _, name in rows[1:]) == ["fastapi", "json"]
+
+
+def test_import_does_not_load_heavy_clients():
+    code = "import sys, main; print(any(m in sys.modules for m in ('google.generativeai', 'uagents', 'requests', 'numpy')))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=main.os.path.dirname(main.__file__),
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == "False"
+
+
+def test_ready_states(monkeypatch):
+    client = TestClient(main.app)
+    monkeypatch.setitem(main._warmup, "state", "disabled")
+    assert client.get("/ready").status_code == 200
+    for state in ("running", "failed"):
+        monkeypatch.setitem(main._warmup, "state", state)
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["ready"] is False
+
+
+def test_lifespan_has_no_deprecation_warning():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        with TestClient(main.app) as client:
+            assert client.get("/").status_code == 200
+
+
+def test_restored_trips_only_serve_latest_endpoints(monkeypatch):
+    route = {"routes": [{"duration": 60, "distance": 1000, "legs": []}]}
+    main.save_trip("route", route, "restore-test", "A", "B")
+    monkeypatch.setattr(main, "last_directions_json", None)
+    monkeypatch.setattr(main, "_restored_latest", {})
+    main._load_latest_trips()
+    assert TestClient(main.app).get("/route/latest").json() == route
+    assert main.answer_route_followup("how long will that take?", session_id="restore-session") is None
+    main.session_routes.pop("restore-session", None)
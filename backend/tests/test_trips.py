@@ -0,0 +1,79 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _flat(coords):
+    return [value for point in coords for value in point]
+
+
+def test_polyline_reference_encoding():
+    # Reference example from the polyline algorithm docs (precision 5)
+    coords = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    assert main._encode_polyline(coords, precision=5) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert _flat(main._decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@", precision=5)) == pytest.approx(_flat(coords))
+
+
+def test_payload_round_trip_compresses_geometry():
+    coords = [[-122.419416 + i * 1e-4, 37.774929 - i * 2e-4] for i in range(300)]
+    payload = {"routes": [{
+        "duration": 100,
+        "geometry": {"type": "LineString", "coordinates": coords},
+        "legs": [{"steps": [{"geometry": {"type": "LineString", "coordinates": coords[:2]}}]}],
+    }]}
+    blob = main.compress_trip_payload(payload)
+    restored = main.decompress_trip_payload(blob)
+    assert len(blob) < len(str(payload)) / 10
+    route = restored["routes"][0]
+    assert route["duration"] == 100
+    assert _flat(route["geometry"]["coordinates"]) == pytest.approx(_flat(coords), abs=1e-6)
+    step_coords = route["legs"][0]["steps"][0]["geometry"]["coordinates"]
+    assert _flat(step_coords) == pytest.approx(_flat(coords[:2]), abs=1e-6)
+
+
+def test_save_list_and_get_trip():
+    trip_id = main.save_trip("route", {"routes": []}, "trip-test", "SF", "San Jose", 60.0, 31.1)
+    main.save_trip("itinerary", {"days": []}, "trip-test-other", "SF", "LA")
+
+    listed = main.list_trips(session_id="trip-test")
+    assert [t["id"] for t in listed] == [trip_id]
+    assert "payload" not in listed[0] and "session_id" not in listed[0]
+    assert any(t["id"] == trip_id for t in main.list_trips(origin="sf", destination="san jose"))
+
+    trip = main.get_trip(trip_id)
+    assert trip["payload"] == {"routes": []}
+    assert main.get_trip(10 ** 9) is None
+
+
+def test_trip_endpoints():
+    client = TestClient(main.app)
+    session_id = main.issue_session_id()
+    trip_id = main.save_trip("route", {"routes": []}, session_id, "A", "B")
+    page = client.get("/trips", params={"session_id": session_id, "limit": 1}).json()
+    assert [t["id"] for t in page["trips"]] == [trip_id]
+    assert "session_id" not in page["trips"][0]
+    trip = client.get(f"/trips/{trip_id}", params={"session_id": session_id}).json()
+    assert trip["payload"] == {"routes": []}
+    assert "session_id" not in trip
+
+    missing = client.get("/trips/999999999", params={"session_id": session_id})
+    assert missing.status_code == 404
+    assert missing.json() == {"detail": "trip not found"}
+
+
+def test_trip_endpoints_are_scoped_to_the_session():
+    client = TestClient(main.app)
+    trip_id = main.save_trip("route", {"routes": []}, main.issue_session_id(), "A", "B")
+    other = main.issue_session_id()
+    assert client.get("/trips").status_code == 422
+    assert client.get(f"/trips/{trip_id}").status_code == 422
+    assert client.get("/trips", params={"session_id": other}).json()["trips"] == []
+    assert client.get(f"/trips/{trip_id}", params={"session_id": other}).status_code == 404
+
+
+def test_trip_endpoints_reject_unissued_session_ids():
+    client = TestClient(main.app)
+    trip_id = main.save_trip("route", {"routes": []}, "guessable", "A", "B")
+    assert client.get("/trips", params={"session_id": "guessable"}).status_code == 403
+    assert client.get(f"/trips/{trip_id}", params={"session_id": "guessable"}).status_code == 403